@@ -5,17 +5,26 @@ import os
 import sys
 import time
 import json
+import orjson
 import copy
 import logging
-import feedparser
+import fastfeedparser
 import requests
 import datetime
 import re
 import random
 import psutil
+import ahocorasick
 import hashlib
+import functools
+import atexit
+import signal
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
 from logging.handlers import RotatingFileHandler
-from threading import Thread, Lock
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from threading import Thread, RLock
 
 # --- 基础配置与路径 ---
 DATA_DIR = "/data"
@@ -27,8 +36,28 @@ if not os.path.exists(DATA_DIR):
 CONFIG_FILE = os.path.join(DATA_DIR, 'config.json')
 # 已处理ID缓存文件
 PROCESSED_FILE = os.path.join(DATA_DIR, 'processed.json')
+# Telegram getUpdates 偏移量，重启后避免重复处理指令
+OFFSET_FILE = os.path.join(DATA_DIR, 'telegram_offset.json')
 # 日志
 LOG_FILE = os.path.join(DATA_DIR, 'monitor.log')
+# 已处理ID最大保留数量
+MAX_PROCESSED_IDS = 500
+# RSS 源地址
+RSS_URL = "https://rss.nodeseek.com/"
+# 推送通知的并发线程数
+NOTIFY_MAX_WORKERS = 8
+# getUpdates 出错时指数退避的最长等待（秒）
+TG_MAX_BACKOFF = 60
+# 主配置合并写盘的间隔（秒）
+CONFIG_FLUSH_INTERVAL = 2
+# 去除 HTML 标签
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+# 正则模式下参与匹配的最大文本长度（截断病态输入，防止 ReDoS）
+REGEX_TEXT_LIMIT = 10000
+# /add 支持的清空标记
+ADD_FLAGS = frozenset(('clean', 'clean-i', 'clean-e'))
+# 开关类指令视为开启的参数
+BOOL_TRUE_VALUES = frozenset(('on', 'true', '1', 'yes', 'y'))
 
 # 日志配置
 log_handler = RotatingFileHandler(LOG_FILE, maxBytes=5*1024*1024, backupCount=1, encoding='utf-8')
@@ -42,13 +71,40 @@ logger = logging.getLogger(__name__)
 
 # --- 全局状态 ---
 start_time = datetime.datetime.now()
+self_process = psutil.Process()  # 当前进程句柄，复用以避免每次重新构造
 last_rss_check_time = None
 last_rss_error = None
+feed_etag = None  # 上次成功处理时 RSS 响应的 ETag
+feed_last_modified = None  # 上次成功处理时 RSS 响应的 Last-Modified
+feed_body_hash = None  # 上次成功处理时 RSS 响应体的摘要，服务器不支持条件请求时兜底
 
 # 全局配置和状态（线程安全）
 global_config = None  # 全局配置对象 {system, users}
-processed_ids = set()  # 已处理的条目ID集合
-config_lock = Lock()  # 保护全局配置和 processed_ids 的锁
+processed_ids = set()  # 已处理的条目ID集合（O(1) 查重）
+processed_order = deque(maxlen=MAX_PROCESSED_IDS)  # 已处理ID的插入顺序（FIFO 淘汰）
+config_lock = RLock()  # 保护全局配置和 processed_ids 的锁（可重入，便于在持锁修改后直接标记待保存）
+file_lock = RLock()  # 串行化配置文件的读写与 mtime 记录
+config_mtime = None  # 最近一次加载/保存时 config.json 的 mtime
+processed_mtime = None  # 最近一次加载/保存时 processed.json 的 mtime
+config_dirty = False  # 主配置是否有尚未写盘的修改
+rules_version = 0  # 规则版本号，主配置每次加载/修改时递增
+_compiled_rules = {'version': None, 'users': {}, 'signatures': {}, 'need_summary': False}  # 按版本缓存的各用户匹配函数
+
+def create_http_session(headers=None, read_retries=None):
+    """创建带连接池和自动重试的 HTTP 会话，复用 TCP/TLS 连接；read_retries=False 时读超时不重试、直接抛出"""
+    session = requests.Session()
+    if headers: session.headers.update(headers)
+    # 不遵循 Retry-After：urllib3 会不设上限地按其等待，可能长时间阻塞监控/监听线程
+    retry = Retry(total=2, read=read_retries, backoff_factor=0.3, status_forcelist=[502, 503, 504],
+                  respect_retry_after_header=False)
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry))
+    return session
+
+tg_session = create_http_session(read_retries=False)  # api.telegram.org（长轮询读超时属正常情况，不重试，直接抛出 ReadTimeout）
+rss_session = create_http_session({  # rss.nodeseek.com（requests 默认已带 gzip/deflate 的 Accept-Encoding）
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+})
+notify_executor = ThreadPoolExecutor(max_workers=NOTIFY_MAX_WORKERS, thread_name_prefix='notify')  # 推送线程池
 
 # --- 数据结构定义 ---
 
@@ -77,68 +133,222 @@ def get_default_user_config():
 
 # --- 配置管理 ---
 
+def read_json(filepath):
+    with open(filepath, 'rb') as f:
+        return orjson.loads(f.read())
+
 def load_json(filepath, default):
     if os.path.exists(filepath):
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return read_json(filepath)
         except Exception as e:
             logger.error(f"加载 {filepath} 失败: {e}")
     return copy.deepcopy(default)
 
-def save_json(filepath, data):
+def dump_json(data, pretty=False):
+    """序列化为 JSON bytes；pretty 用于需要人工编辑的文件"""
+    option = orjson.OPT_NON_STR_KEYS
+    if pretty: option |= orjson.OPT_INDENT_2
+    return orjson.dumps(data, option=option)
+
+def save_json(filepath, data, pretty=False):
+    """原子写入 JSON；data 也可以是已序列化的 bytes"""
     try:
+        if not isinstance(data, bytes): data = dump_json(data, pretty)
         temp = filepath + '.tmp'
-        with open(temp, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        with open(temp, 'wb') as f:
+            f.write(data)
         os.replace(temp, filepath)
+        return True
     except Exception as e:
         logger.error(f"保存 {filepath} 失败: {e}")
+        return False
+
+def get_mtime(filepath):
+    try:
+        return os.stat(filepath).st_mtime_ns
+    except OSError:
+        return None
+
+def apply_main_config(config, skip_if_dirty=False):
+    """补全缺省字段后替换内存中的主配置；skip_if_dirty 时若有未写盘的修改则不替换，返回是否已替换"""
+    global global_config, rules_version
+    if 'system' not in config:
+        config['system'] = copy.deepcopy(DEFAULT_SYSTEM_CONFIG['system'])
+    if 'users' not in config:
+        config['users'] = {}
+    for k, v in DEFAULT_SYSTEM_CONFIG['system'].items():
+        if k not in config['system']:
+            config['system'][k] = v
+
+    with config_lock:
+        if skip_if_dirty and config_dirty:
+            return False
+        global_config = config
+        rules_version += 1
+    return True
+
+def apply_processed(processed_list):
+    """替换内存中的已处理ID"""
+    global processed_ids, processed_order
+    with config_lock:
+        processed_order = deque(dict.fromkeys(processed_list), maxlen=MAX_PROCESSED_IDS)
+        processed_ids = set(processed_order)
 
 def load_config(force_reload=False):
     """加载配置到全局变量中"""
-    global global_config, processed_ids
+    global config_mtime, processed_mtime
 
-    with config_lock:
+    with file_lock:
         # 如果已经加载过且不强制重载，直接返回
         if not force_reload and global_config is not None:
             return
 
         # 加载主配置
-        config = load_json(CONFIG_FILE, DEFAULT_SYSTEM_CONFIG)
+        config_mtime = get_mtime(CONFIG_FILE)
+        apply_main_config(load_json(CONFIG_FILE, DEFAULT_SYSTEM_CONFIG))
 
-        if 'system' not in config:
-            config['system'] = copy.deepcopy(DEFAULT_SYSTEM_CONFIG['system'])
-        if 'users' not in config:
-            config['users'] = {}
-        for k, v in DEFAULT_SYSTEM_CONFIG['system'].items():
-            if k not in config['system']:
-                config['system'][k] = v
+        # 加载已处理ID（独立管理）
+        processed_mtime = get_mtime(PROCESSED_FILE)
+        apply_processed(load_json(PROCESSED_FILE, []))
 
-        global_config = config
+def reload_config_if_changed():
+    """配置文件在外部被修改（mtime 变化）时才重新读取，否则沿用内存中的配置"""
+    global config_mtime, processed_mtime
 
-        # 加载已处理ID（独立管理）
-        processed_list = load_json(PROCESSED_FILE, [])
-        processed_ids = set(processed_list)
+    with file_lock:
+        mtime = get_mtime(CONFIG_FILE)
+        if mtime is not None and mtime != config_mtime:
+            config_mtime = mtime
+            try:
+                if apply_main_config(read_json(CONFIG_FILE), skip_if_dirty=True):
+                    logger.info("检测到配置文件变更，已重新加载")
+                else:
+                    # 与改动前一致以内存为准：待写盘的指令修改会覆盖这次外部修改
+                    logger.warning("配置文件在外部被修改，但存在尚未写盘的指令修改，保留内存中的配置（外部修改将被覆盖）")
+            except Exception as e:
+                logger.error(f"重新加载 {CONFIG_FILE} 失败，保留当前配置: {e}")
+
+        mtime = get_mtime(PROCESSED_FILE)
+        if mtime is not None and mtime != processed_mtime:
+            processed_mtime = mtime
+            try:
+                apply_processed(read_json(PROCESSED_FILE))
+            except Exception as e:
+                logger.error(f"重新加载 {PROCESSED_FILE} 失败，保留当前记录: {e}")
 
 def save_main_config():
     """保存主配置（system, users）"""
+    global config_mtime
+    try:
+        # 在锁内直接序列化得到快照，代替深拷贝后再序列化
+        with config_lock:
+            data = dump_json({
+                'system': global_config.get('system', {}),
+                'users': global_config.get('users', {})
+            }, pretty=True)
+    except Exception as e:
+        logger.error(f"序列化主配置失败: {e}")
+        return False
+    with file_lock:
+        if not save_json(CONFIG_FILE, data):
+            return False
+        config_mtime = get_mtime(CONFIG_FILE)
+    return True
+
+def mark_config_dirty():
+    """标记主配置已修改，由后台线程合并写盘"""
+    global config_dirty, rules_version
     with config_lock:
-        data = {
-            'system': global_config.get('system', {}),
-            'users': global_config.get('users', {})
-        }
-    save_json(CONFIG_FILE, data)
+        config_dirty = True
+        rules_version += 1
+
+def flush_config():
+    """若主配置有未保存的修改，立即写盘"""
+    global config_dirty
+    # 持有 file_lock 直到写盘完成，避免清除标记后、写盘前被外部重载替换掉待保存的修改
+    with file_lock:
+        with config_lock:
+            if not config_dirty:
+                return
+            config_dirty = False
+        if not save_main_config():
+            with config_lock:
+                config_dirty = True
+
+def config_flush_loop():
+    """后台定期写盘，将连续的多次修改合并为一次写入"""
+    while True:
+        time.sleep(CONFIG_FLUSH_INTERVAL)
+        try:
+            flush_config()
+        except Exception as e:
+            logger.error(f"配置写盘异常: {e}")
 
 def save_processed():
-    """保存已处理ID缓存，包含限制逻辑"""
+    """保存已处理ID缓存（按插入顺序，最多保留 MAX_PROCESSED_IDS 条）"""
+    global processed_mtime
+    with config_lock:
+        p_list = list(processed_order)
+    with file_lock:
+        if save_json(PROCESSED_FILE, p_list):
+            processed_mtime = get_mtime(PROCESSED_FILE)
+
+def mark_processed(key):
+    """标记条目为已处理，超出上限时淘汰最早的ID。需在持有 config_lock 时调用"""
+    if key in processed_ids:
+        return False
+    if len(processed_order) == processed_order.maxlen:
+        processed_ids.discard(processed_order[0])
+    processed_order.append(key)
+    processed_ids.add(key)
+    return True
+
+def extract_user_rules(user_conf):
+    """提取用户的匹配规则，关键词统一转为小写元组（可哈希，用作规则签名）"""
+    settings = user_conf.get('settings', {})
+    return {
+        'match_summary': settings.get('match_summary', False),
+        'full_word': settings.get('full_word_match', False),
+        'use_regex': settings.get('regex_match', False),
+        'global_exclude': tuple(b.lower() for b in user_conf.get('global_exclude', [])),
+        'keywords': tuple(
+            (r['word'], r['word'].lower(),
+             tuple(i.lower() for i in r.get('include', [])),
+             tuple(e.lower() for e in r.get('exclude', [])))
+            for r in user_conf['keywords']
+        )
+    }
+
+def get_compiled_rules():
+    """获取各用户的专用匹配函数 ({chat_id: matcher}, 是否有用户匹配摘要)，仅在规则版本变化时重建"""
+    with config_lock:
+        if _compiled_rules['version'] == rules_version:
+            return _compiled_rules['users'], _compiled_rules['need_summary']
+        version = rules_version
+        # 在锁内直接提取为不可变的元组，无需深拷贝整个用户配置
+        users_rules = {chat_id: extract_user_rules(user_conf)
+                       for chat_id, user_conf in global_config['users'].items() if user_conf.get('keywords')}
+
+    compiled = {}
+    signatures = {}
+    need_summary = False
+    for chat_id, rules in users_rules.items():
+        need_summary = need_summary or rules['match_summary']
+        # 仅重建规则实际发生变化的用户，其余沿用已有的匹配函数
+        signature = tuple(rules.values())
+        signatures[chat_id] = signature
+        if _compiled_rules['signatures'].get(chat_id) == signature:
+            compiled[chat_id] = _compiled_rules['users'][chat_id]
+        else:
+            compiled[chat_id] = build_matcher(rules)
+
     with config_lock:
-        p_list = list(processed_ids)
-        if len(p_list) > 500:
-            p_list = p_list[-500:]
-            processed_ids.clear()
-            processed_ids.update(p_list)
-    save_json(PROCESSED_FILE, p_list)
+        _compiled_rules['version'] = version
+        _compiled_rules['users'] = compiled
+        _compiled_rules['signatures'] = signatures
+        _compiled_rules['need_summary'] = need_summary
+    return compiled, need_summary
 
 def get_user_config(chat_id_str):
     """获取用户配置"""
@@ -165,7 +375,7 @@ def send_telegram_message(message, bot_token, chat_id, reply_to=None, max_retrie
             url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
             data = {"chat_id": chat_id, "text": message, "parse_mode": "HTML"}
             if reply_to: data["reply_to_message_id"] = reply_to
-            resp = requests.post(url, data=data, timeout=10)
+            resp = tg_session.post(url, data=data, timeout=10)
             if resp.status_code == 200:
                 return True
             elif resp.status_code == 429:  # Rate limit
@@ -183,9 +393,15 @@ def send_telegram_message(message, bot_token, chat_id, reply_to=None, max_retrie
                 time.sleep(2 ** attempt)
     return False
 
+def send_notifications(chat_id, items, bot_token):
+    """按顺序向单个用户推送命中通知"""
+    for msg, title, kws_str in items:
+        if send_telegram_message(msg, bot_token, chat_id):
+            logger.info(f"向用户 {chat_id} 推送: {title} (规则: {kws_str})")
+
 def disable_telegram_webhook(bot_token):
     try:
-        requests.post(f"https://api.telegram.org/bot{bot_token}/deleteWebhook", timeout=10)
+        tg_session.post(f"https://api.telegram.org/bot{bot_token}/deleteWebhook", timeout=10)
     except Exception as e:
         logger.warning(f"删除 webhook 失败: {e}")
 
@@ -207,10 +423,16 @@ def set_telegram_bot_commands(bot_token):
         {"command": "help", "description": "帮助说明"},
     ]
     try:
-        requests.post(f"https://api.telegram.org/bot{bot_token}/setMyCommands", json={"commands": commands}, timeout=10)
+        tg_session.post(f"https://api.telegram.org/bot{bot_token}/setMyCommands", json={"commands": commands}, timeout=10)
     except Exception as e:
         logger.warning(f"设置命令菜单失败: {e}")
 
+def strip_tags(text):
+    """去除 HTML 标签；不含 '<' 的文本（多数标题/作者）直接返回"""
+    if '<' not in text:
+        return text
+    return HTML_TAG_RE.sub('', text)
+
 def format_uptime():
     s = (datetime.datetime.now() - start_time).total_seconds()
     d, s = divmod(s, 86400)
@@ -219,10 +441,301 @@ def format_uptime():
     return f"{int(d)}天{int(h)}小时{int(m)}分"
 
 def bool_from_text(text):
-    t = text.strip().lower()
-    return t in ('on', 'true', '1', 'yes', 'y')
+    return text.strip().lower() in BOOL_TRUE_VALUES
 
 # --- 核心逻辑 ---
+def cmd_add(bot_token, chat_id, msg_id, args_str, user_conf):
+    """添加或更新关键词规则"""
+    users_keywords = user_conf['keywords']
+    users_defaults = user_conf['defaults']
+    if not args_str:
+        send_telegram_message("❌ 请输入参数。示例：/add mk clean +出", bot_token, chat_id, msg_id)
+        return
+
+    tokens = args_str.split()
+
+    # 1. 解析 flags 和 switches
+    flags = set()
+    switches_inc = []
+    switches_exc = []
+    keywords = []
+
+    for t in tokens:
+        tl = t.lower()
+        if tl in ADD_FLAGS:
+            flags.add(tl)
+        elif t.startswith('+') and len(t) > 1:
+            switches_inc.append(t[1:])
+        elif t.startswith('-') and len(t) > 1:
+            switches_exc.append(t[1:])
+        else:
+            keywords.append(t)
+
+    if not keywords:
+        send_telegram_message("❌ 未识别到关键词", bot_token, chat_id, msg_id)
+        return
+
+    # 验证关键词
+    invalid_keywords = [kw for kw in keywords if not validate_keyword(kw)]
+    if invalid_keywords:
+        send_telegram_message(f"❌ 关键词不合法: {', '.join(invalid_keywords)}", bot_token, chat_id, msg_id)
+        return
+
+    logs = []
+    rule_index = {x['word']: x for x in users_keywords}
+    for kw in keywords:
+        # 查找或创建
+        rule = rule_index.get(kw)
+        is_new = False
+        if not rule:
+            rule = {"word": kw, "include": [], "exclude": []}
+            users_keywords.append(rule)
+            rule_index[kw] = rule
+            is_new = True
+
+        # 处理 clean
+        if 'clean' in flags:
+            rule['include'] = []
+            rule['exclude'] = []
+        else:
+            if 'clean-i' in flags: rule['include'] = []
+            if 'clean-e' in flags: rule['exclude'] = []
+
+        # 合并 defaults (仅新建且未clean时) 与 switches，保持顺序去重
+        new_inc, new_exc = switches_inc, switches_exc
+        if is_new and not flags:
+            new_inc = users_defaults.get('include', []) + switches_inc
+            new_exc = users_defaults.get('exclude', []) + switches_exc
+        if new_inc: rule['include'] = list(dict.fromkeys(rule['include'] + new_inc))
+        if new_exc: rule['exclude'] = list(dict.fromkeys(rule['exclude'] + new_exc))
+
+        # 生成日志
+        info = f"<b>{kw}</b>"
+        extras = []
+        if rule['include']: extras.append(f"➕ 必含: [{','.join(rule['include'])}]")
+        if rule['exclude']: extras.append(f"⛔ 排除: [{','.join(rule['exclude'])}]")
+        if extras: info += " " + " ".join(extras)
+        logs.append(info)
+
+    send_telegram_message("✅ 规则已更新：\n" + "\n".join(logs), bot_token, chat_id, msg_id)
+
+def cmd_del(bot_token, chat_id, msg_id, args_str, user_conf):
+    """删除关键词规则"""
+    targets = args_str.split()
+    if not targets:
+        send_telegram_message("❌ 请指定要删除的关键词", bot_token, chat_id, msg_id)
+        return
+    existing = {r['word'] for r in user_conf['keywords']}
+    deleted = [kw for kw in dict.fromkeys(targets) if kw in existing]
+    if deleted:
+        deleted_set = set(deleted)
+        user_conf['keywords'] = [r for r in user_conf['keywords'] if r['word'] not in deleted_set]
+        send_telegram_message(f"🗑️ 已删除: {', '.join(deleted)}", bot_token, chat_id, msg_id)
+    else:
+        send_telegram_message("⚠️ 未找到匹配的规则", bot_token, chat_id, msg_id)
+
+def cmd_list(bot_token, chat_id, msg_id, args_str, user_conf):
+    """查看当前用户的配置"""
+    users_keywords = user_conf['keywords']
+    users_defaults = user_conf['defaults']
+    msg_lines = ["<b>📋 您的配置</b>"]
+    defs = []
+    if users_defaults.get('include'): defs.append(f"默认必含: {','.join(users_defaults['include'])}")
+    if users_defaults.get('exclude'): defs.append(f"默认排除: {','.join(users_defaults['exclude'])}")
+    if defs:
+        msg_lines.append("<i>默认模板:</i>")
+        msg_lines.extend([f"  {d}" for d in defs])
+        msg_lines.append("")
+    if users_keywords:
+        msg_lines.append(f"<i>监控规则 ({len(users_keywords)}):</i>")
+        for i, r in enumerate(users_keywords):
+            line = f"{i+1}. <b>{r['word']}</b>"
+            extras = []
+            if r.get('include'): extras.append(f"➕ 包含: {', '.join(r['include'])}")
+            if r.get('exclude'): extras.append(f"⛔ 排除: {', '.join(r['exclude'])}")
+            if extras: line += f" ({' '.join(extras)})"
+            msg_lines.append(line)
+    else:
+        msg_lines.append("（暂无监控规则）")
+    g_exc = user_conf.get('global_exclude', [])
+    if g_exc:
+        msg_lines.append("")
+        msg_lines.append(f"<i>全局屏蔽:</i> {', '.join(g_exc)}")
+    send_telegram_message("\n".join(msg_lines), bot_token, chat_id, msg_id)
+
+def cmd_include(bot_token, chat_id, msg_id, args_str, user_conf):
+    """设置默认必含关键词"""
+    if not args_str:
+        user_conf['defaults']['include'] = []
+        send_telegram_message("✅ 已清空默认必含关键词", bot_token, chat_id, msg_id)
+    else:
+        kws = args_str.split()
+        user_conf['defaults']['include'] = list(dict.fromkeys(kws))
+        send_telegram_message(f"✅ 默认必含已设为: {', '.join(kws)}", bot_token, chat_id, msg_id)
+
+def cmd_exclude(bot_token, chat_id, msg_id, args_str, user_conf):
+    """设置默认排除关键词"""
+    if not args_str:
+        user_conf['defaults']['exclude'] = []
+        send_telegram_message("✅ 已清空默认排除关键词", bot_token, chat_id, msg_id)
+    else:
+        kws = args_str.split()
+        user_conf['defaults']['exclude'] = list(dict.fromkeys(kws))
+        send_telegram_message(f"✅ 默认排除已设为: {', '.join(kws)}", bot_token, chat_id, msg_id)
+
+def cmd_block(bot_token, chat_id, msg_id, args_str, user_conf):
+    """添加全局屏蔽词"""
+    kws = args_str.split()
+    if not kws:
+        send_telegram_message(f"❌ 请指定关键词", bot_token, chat_id, msg_id)
+        return
+    g_exc = user_conf.get('global_exclude', [])
+    existing = set(g_exc)
+    changed = False
+    for k in kws:
+        if k not in existing:
+            g_exc.append(k)
+            existing.add(k)
+            changed = True
+    if changed:
+        user_conf['global_exclude'] = g_exc
+        send_telegram_message(f"🚫 已添加到全局屏蔽", bot_token, chat_id, msg_id)
+
+def cmd_unblock(bot_token, chat_id, msg_id, args_str, user_conf):
+    """解除全局屏蔽词"""
+    kws = args_str.split()
+    if not kws:
+        send_telegram_message(f"❌ 请指定关键词", bot_token, chat_id, msg_id)
+        return
+    g_exc = user_conf.get('global_exclude', [])
+    initial_len = len(g_exc)
+    kws_set = set(kws)
+    user_conf['global_exclude'] = [x for x in g_exc if x not in kws_set]
+    if len(user_conf['global_exclude']) < initial_len:
+        send_telegram_message(f"✅ 已解除屏蔽", bot_token, chat_id, msg_id)
+    else:
+        send_telegram_message("⚠️ 未找到相关屏蔽词", bot_token, chat_id, msg_id)
+
+def cmd_blocklist(bot_token, chat_id, msg_id, args_str, user_conf):
+    """查看全局屏蔽列表"""
+    g_exc = user_conf.get('global_exclude', [])
+    if not g_exc:
+        send_telegram_message("🚫 全局屏蔽列表为空", bot_token, chat_id, msg_id)
+    else:
+        send_telegram_message(f"<b>🚫 全局屏蔽列表</b>\n{', '.join(g_exc)}", bot_token, chat_id, msg_id)
+
+def make_setting_handler(key, label):
+    """生成开关类个人设置指令的处理函数"""
+    def handler(bot_token, chat_id, msg_id, args_str, user_conf):
+        val = bool_from_text(args_str)
+        user_conf['settings'][key] = val
+        send_telegram_message(f"{label}: {'开启' if val else '关闭'}", bot_token, chat_id, msg_id)
+    return handler
+
+def cmd_setinterval(bot_token, chat_id, msg_id, args_str, user_conf):
+    """设置检测间隔（仅管理员）"""
+    admin_id = os.environ.get('TG_CHAT_ID', '').strip()
+    if chat_id != admin_id:
+        send_telegram_message("⛔ 只有管理员可以使用此命令", bot_token, chat_id, msg_id)
+        return
+    try:
+        # int() 一次完成校验与转换（isdigit 会放过 "²" 之类 int() 无法解析的字符）
+        min_int, max_int = map(int, args_str.split())
+        if min_int < 0 or max_int < 0: raise ValueError
+    except ValueError:
+        send_telegram_message("❌ 格式: /setinterval 30 60", bot_token, chat_id, msg_id)
+        return
+    with config_lock:
+        global_config['system']['check_min_interval'] = min_int
+        global_config['system']['check_max_interval'] = max_int
+        mark_config_dirty()
+    send_telegram_message(f"⏱️ 间隔已设为 {min_int}-{max_int}秒", bot_token, chat_id, msg_id)
+
+def cmd_help(bot_token, chat_id, msg_id, args_str, user_conf):
+    """显示帮助"""
+    is_admin = (chat_id == os.environ.get('TG_CHAT_ID', '').strip())
+    msg = (
+        "<b>👋 NodeSeek 监控机器人</b>\n\n"
+        "<b>📝 规则管理</b>\n"
+        "/add [clean] 词1 [词2...] [+必含] [-排除] - <i>批量添加</i>\n"
+        "/del 词1 [词2...] - <i>批量删除</i>\n"
+        "/list - <i>查看规则</i>\n"
+        "/block /unblock - <i>全局屏蔽</i>\n\n"
+        "<b>⚙️ 默认模板</b>\n"
+        "/include 词1 [词2...] - <i>设默认必含</i>\n"
+        "/exclude 词1 [词2...] - <i>设默认排除</i>\n\n"
+        "<b>🔧 个人设置</b>\n"
+        "/setsummary on/off - <i>匹配摘要</i>\n"
+        "/setfullword on/off - <i>完整词</i>\n"
+        "/setregex on/off - <i>正则</i>\n"
+    )
+    if is_admin: msg += "\n<b>👮 管理员</b>\n/setinterval\n"
+    msg += "\n/status - <i>查看状态</i>"
+    send_telegram_message(msg, bot_token, chat_id, msg_id)
+
+def cmd_status(bot_token, chat_id, msg_id, args_str, user_conf):
+    """查看运行状态"""
+    mem = self_process.memory_info().rss / 1024 / 1024
+    uptime = format_uptime()
+    min_int = global_config['system']['check_min_interval']
+    max_int = global_config['system']['check_max_interval']
+    proc_count = len(processed_ids)
+    my_rules = len(user_conf['keywords'])
+    settings = user_conf.get('settings', {})
+    match_summary = "开" if settings.get('match_summary') else "关"
+    full_word = "开" if settings.get('full_word_match') else "关"
+    regex = "开" if settings.get('regex_match') else "关"
+    sys_info = ""
+    if chat_id == os.environ.get('TG_CHAT_ID', '').strip():
+        sys_info = (
+            f"\n<b>💻 系统指标</b>\n"
+            f"检测间隔: {min_int}-{max_int}s\n"
+            f"已处理ID: {proc_count}\n"
+            f"连续错误: {last_rss_error or '无'}\n"
+        )
+    msg = (
+        f"<b>📊 状态报告</b>\n"
+        f"运行时间: {uptime}\n"
+        f"内存占用: {mem:.1f} MB\n"
+        f"您的规则: {my_rules} 条\n"
+        f"匹配摘要: {match_summary} | 全词匹配: {full_word} | 正则: {regex}\n"
+        f"{sys_info}"
+        f"\n最后检测: {last_rss_check_time.strftime('%H:%M:%S') if last_rss_check_time else '从未'}"
+    )
+    send_telegram_message(msg, bot_token, chat_id, msg_id)
+
+# 指令分发表：指令名 -> 处理函数(bot_token, chat_id, msg_id, args_str, user_conf)
+COMMAND_HANDLERS = {
+    "/add": cmd_add,
+    "/del": cmd_del,
+    "/list": cmd_list,
+    "/include": cmd_include,
+    "/exclude": cmd_exclude,
+    "/block": cmd_block,
+    "/unblock": cmd_unblock,
+    "/blocklist": cmd_blocklist,
+    "/setsummary": make_setting_handler('match_summary', "🔎 摘要匹配"),
+    "/setfullword": make_setting_handler('full_word_match', "🧩 完整词匹配"),
+    "/setregex": make_setting_handler('regex_match', "🧠 正则匹配"),
+    "/setinterval": cmd_setinterval,
+    "/help": cmd_help,
+    "/start": cmd_help,
+    "/status": cmd_status,
+}
+
+def load_telegram_offset(bot_id):
+    """读取上次保存的 getUpdates offset；update_id 按 bot 独立计数，文件属于其他 bot 或格式不对时从 0 开始"""
+    data = load_json(OFFSET_FILE, {})
+    if not isinstance(data, dict) or data.get('bot_id') != bot_id:
+        return 0
+    offset = data.get('offset', 0)
+    return offset if isinstance(offset, int) else 0
+
+def backoff_sleep(delay):
+    """按当前退避上限随机等待（full jitter），返回翻倍后的下一次上限"""
+    time.sleep(0.5 + random.uniform(0, delay))
+    return min(delay * 2, TG_MAX_BACKOFF)
+
 def telegram_command_listener():
     while True:
         try:
@@ -235,21 +748,33 @@ def telegram_command_listener():
     disable_telegram_webhook(bot_token)
     set_telegram_bot_commands(bot_token)
     
-    offset = 0
+    bot_id = bot_token.split(':')[0]
+    offset = load_telegram_offset(bot_id)
+    url = f"https://api.telegram.org/bot{bot_token}/getUpdates"
+    params = {"timeout": 60, "offset": offset, "allowed_updates": json.dumps(["message"])}
+    error_backoff = 1
     while True:
         try:
-            url = f"https://api.telegram.org/bot{bot_token}/getUpdates"
-            resp = requests.get(url, params={"timeout": 60, "offset": offset}, timeout=65)
+            params["offset"] = offset
+            resp = tg_session.get(url, params=params, timeout=65)
+            if resp.status_code == 429:
+                retry_after = resp.json().get('parameters', {}).get('retry_after', 5)
+                logger.warning(f"getUpdates 触发速率限制，等待 {retry_after} 秒")
+                time.sleep(retry_after + random.uniform(0, 1))
+                continue
             if resp.status_code != 200:
-                time.sleep(5)
+                error_backoff = backoff_sleep(error_backoff)
                 continue
             
-            data = resp.json()
+            data = orjson.loads(resp.content)
             if not data.get("ok"):
-                time.sleep(5)
+                error_backoff = backoff_sleep(error_backoff)
                 continue
+            error_backoff = 1
 
-            for update in data.get("result", []):
+            updates = data.get("result", [])
+            if updates: reload_config_if_changed()
+            for update in updates:
                 offset = update["update_id"] + 1
                 chat_id = None
                 user_conf = None
@@ -270,276 +795,48 @@ def telegram_command_listener():
 
                     user_conf = get_user_config(chat_id)
                     __uc_orig = json.dumps(user_conf, ensure_ascii=False, sort_keys=True)
-                    users_keywords = user_conf['keywords']
-                    users_defaults = user_conf['defaults']
-
-                    if cmd_raw == "/add":
-                        if not args_str:
-                            send_telegram_message("❌ 请输入参数。示例：/add mk clean +出", bot_token, chat_id, msg_id)
-                            continue
-
-                        tokens = args_str.split()
-
-                        # 1. 解析 flags 和 switches
-                        flags = []
-                        switches_inc = []
-                        switches_exc = []
-                        keywords = []
-
-                        for t in tokens:
-                            tl = t.lower()
-                            if tl in ('clean', 'clean-i', 'clean-e'):
-                                flags.append(tl)
-                            elif t.startswith('+') and len(t) > 1:
-                                switches_inc.append(t[1:])
-                            elif t.startswith('-') and len(t) > 1:
-                                switches_exc.append(t[1:])
-                            else:
-                                keywords.append(t)
-
-                        if not keywords:
-                            send_telegram_message("❌ 未识别到关键词", bot_token, chat_id, msg_id)
-                            continue
-
-                        # 验证关键词
-                        invalid_keywords = [kw for kw in keywords if not validate_keyword(kw)]
-                        if invalid_keywords:
-                            send_telegram_message(f"❌ 关键词不合法: {', '.join(invalid_keywords)}", bot_token, chat_id, msg_id)
-                            continue
-
-                        logs = []
-                        for kw in keywords:
-                            # 查找或创建
-                            rule = next((x for x in users_keywords if x['word'] == kw), None)
-                            is_new = False
-                            if not rule:
-                                rule = {"word": kw, "include": [], "exclude": []}
-                                users_keywords.append(rule)
-                                is_new = True
-
-                            # 处理 clean
-                            if 'clean' in flags:
-                                rule['include'] = []
-                                rule['exclude'] = []
-                            else:
-                                if 'clean-i' in flags: rule['include'] = []
-                                if 'clean-e' in flags: rule['exclude'] = []
-
-                            # 处理 defaults (仅新建且未clean时)
-                            if is_new and not flags:
-                                for d_inc in users_defaults.get('include', []):
-                                    if d_inc not in rule['include']: rule['include'].append(d_inc)
-                                for d_exc in users_defaults.get('exclude', []):
-                                    if d_exc not in rule['exclude']: rule['exclude'].append(d_exc)
-
-                            # 处理 switches
-                            for inc in switches_inc:
-                                if inc not in rule['include']: rule['include'].append(inc)
-                            for exc in switches_exc:
-                                if exc not in rule['exclude']: rule['exclude'].append(exc)
-
-                            # 生成日志
-                            info = f"<b>{kw}</b>"
-                            extras = []
-                            if rule['include']: extras.append(f"➕ 必含: [{','.join(rule['include'])}]")
-                            if rule['exclude']: extras.append(f"⛔ 排除: [{','.join(rule['exclude'])}]")
-                            if extras: info += " " + " ".join(extras)
-                            logs.append(info)
-
-                        send_telegram_message("✅ 规则已更新：\n" + "\n".join(logs), bot_token, chat_id, msg_id)
-
-                    elif cmd_raw == "/del":
-                        targets = args_str.split()
-                        if not targets:
-                            send_telegram_message("❌ 请指定要删除的关键词", bot_token, chat_id, msg_id)
-                            continue
-                        deleted = []
-                        for kw in targets:
-                            initial_len = len(user_conf['keywords'])
-                            user_conf['keywords'] = [r for r in user_conf['keywords'] if r['word'] != kw]
-                            if len(user_conf['keywords']) < initial_len:
-                                deleted.append(kw)
-                        if deleted:
-                            send_telegram_message(f"🗑️ 已删除: {', '.join(deleted)}", bot_token, chat_id, msg_id)
-                        else:
-                            send_telegram_message("⚠️ 未找到匹配的规则", bot_token, chat_id, msg_id)
-
-                    elif cmd_raw == "/list":
-                        msg_lines = ["<b>📋 您的配置</b>"]
-                        defs = []
-                        if users_defaults.get('include'): defs.append(f"默认必含: {','.join(users_defaults['include'])}")
-                        if users_defaults.get('exclude'): defs.append(f"默认排除: {','.join(users_defaults['exclude'])}")
-                        if defs:
-                            msg_lines.append("<i>默认模板:</i>")
-                            msg_lines.extend([f"  {d}" for d in defs])
-                            msg_lines.append("")
-                        if users_keywords:
-                            msg_lines.append(f"<i>监控规则 ({len(users_keywords)}):</i>")
-                            for i, r in enumerate(users_keywords):
-                                line = f"{i+1}. <b>{r['word']}</b>"
-                                extras = []
-                                if r.get('include'): extras.append(f"➕ 包含: {', '.join(r['include'])}")
-                                if r.get('exclude'): extras.append(f"⛔ 排除: {', '.join(r['exclude'])}")
-                                if extras: line += f" ({' '.join(extras)})"
-                                msg_lines.append(line)
-                        else:
-                            msg_lines.append("（暂无监控规则）")
-                        g_exc = user_conf.get('global_exclude', [])
-                        if g_exc:
-                            msg_lines.append("")
-                            msg_lines.append(f"<i>全局屏蔽:</i> {', '.join(g_exc)}")
-                        send_telegram_message("\n".join(msg_lines), bot_token, chat_id, msg_id)
-
-                    elif cmd_raw == "/include":
-                        if not args_str:
-                            user_conf['defaults']['include'] = []
-                            send_telegram_message("✅ 已清空默认必含关键词", bot_token, chat_id, msg_id)
-                        else:
-                            kws = args_str.split()
-                            user_conf['defaults']['include'] = list(dict.fromkeys(kws))
-                            send_telegram_message(f"✅ 默认必含已设为: {', '.join(kws)}", bot_token, chat_id, msg_id)
-
-                    elif cmd_raw == "/exclude":
-                        if not args_str:
-                            user_conf['defaults']['exclude'] = []
-                            send_telegram_message("✅ 已清空默认排除关键词", bot_token, chat_id, msg_id)
-                        else:
-                            kws = args_str.split()
-                            user_conf['defaults']['exclude'] = list(dict.fromkeys(kws))
-                            send_telegram_message(f"✅ 默认排除已设为: {', '.join(kws)}", bot_token, chat_id, msg_id)
-
-                    elif cmd_raw in ("/block", "/unblock"):
-                        kws = args_str.split()
-                        if not kws:
-                            send_telegram_message(f"❌ 请指定关键词", bot_token, chat_id, msg_id)
-                            continue
-                        g_exc = user_conf.get('global_exclude', [])
-                        changed = False
-                        if cmd_raw == "/block":
-                            for k in kws:
-                                if k not in g_exc:
-                                    g_exc.append(k)
-                                    changed = True
-                            if changed:
-                                user_conf['global_exclude'] = g_exc
-                                send_telegram_message(f"🚫 已添加到全局屏蔽", bot_token, chat_id, msg_id)
-                        else:
-                            initial_len = len(g_exc)
-                            user_conf['global_exclude'] = [x for x in g_exc if x not in kws]
-                            if len(user_conf['global_exclude']) < initial_len:
-                                send_telegram_message(f"✅ 已解除屏蔽", bot_token, chat_id, msg_id)
-                            else:
-                                send_telegram_message("⚠️ 未找到相关屏蔽词", bot_token, chat_id, msg_id)
-
-                    elif cmd_raw == "/blocklist":
-                        g_exc = user_conf.get('global_exclude', [])
-                        if not g_exc:
-                            send_telegram_message("🚫 全局屏蔽列表为空", bot_token, chat_id, msg_id)
-                        else:
-                            send_telegram_message(f"<b>🚫 全局屏蔽列表</b>\n{', '.join(g_exc)}", bot_token, chat_id, msg_id)
-
-                    elif cmd_raw == "/setsummary":
-                        val = bool_from_text(args_str)
-                        user_conf['settings']['match_summary'] = val
-                        send_telegram_message(f"🔎 摘要匹配: {'开启' if val else '关闭'}", bot_token, chat_id, msg_id)
-
-                    elif cmd_raw == "/setfullword":
-                        val = bool_from_text(args_str)
-                        user_conf['settings']['full_word_match'] = val
-                        send_telegram_message(f"🧩 完整词匹配: {'开启' if val else '关闭'}", bot_token, chat_id, msg_id)
-
-                    elif cmd_raw == "/setregex":
-                        val = bool_from_text(args_str)
-                        user_conf['settings']['regex_match'] = val
-                        send_telegram_message(f"🧠 正则匹配: {'开启' if val else '关闭'}", bot_token, chat_id, msg_id)
-
-                    elif cmd_raw == "/setinterval":
-                        admin_id = os.environ.get('TG_CHAT_ID', '').strip()
-                        if chat_id != admin_id:
-                            send_telegram_message("⛔ 只有管理员可以使用此命令", bot_token, chat_id, msg_id)
-                            continue
-                        parts = args_str.split()
-                        if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
-                            with config_lock:
-                                global_config['system']['check_min_interval'] = int(parts[0])
-                                global_config['system']['check_max_interval'] = int(parts[1])
-                            save_main_config()
-                            send_telegram_message(f"⏱️ 间隔已设为 {parts[0]}-{parts[1]}秒", bot_token, chat_id, msg_id)
-                        else:
-                            send_telegram_message("❌ 格式: /setinterval 30 60", bot_token, chat_id, msg_id)
-
-                    elif cmd_raw in ("/help", "/start"):
-                        is_admin = (chat_id == os.environ.get('TG_CHAT_ID', '').strip())
-                        msg = (
-                            "<b>👋 NodeSeek 监控机器人</b>\n\n"
-                            "<b>📝 规则管理</b>\n"
-                            "/add [clean] 词1 [词2...] [+必含] [-排除] - <i>批量添加</i>\n"
-                            "/del 词1 [词2...] - <i>批量删除</i>\n"
-                            "/list - <i>查看规则</i>\n"
-                            "/block /unblock - <i>全局屏蔽</i>\n\n"
-                            "<b>⚙️ 默认模板</b>\n"
-                            "/include 词1 [词2...] - <i>设默认必含</i>\n"
-                            "/exclude 词1 [词2...] - <i>设默认排除</i>\n\n"
-                            "<b>🔧 个人设置</b>\n"
-                            "/setsummary on/off - <i>匹配摘要</i>\n"
-                            "/setfullword on/off - <i>完整词</i>\n"
-                            "/setregex on/off - <i>正则</i>\n"
-                        )
-                        if is_admin: msg += "\n<b>👮 管理员</b>\n/setinterval\n"
-                        msg += "\n/status - <i>查看状态</i>"
-                        send_telegram_message(msg, bot_token, chat_id, msg_id)
-                        
-                    elif cmd_raw == "/status":
-                        mem = psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024
-                        uptime = format_uptime()
-                        min_int = global_config['system']['check_min_interval']
-                        max_int = global_config['system']['check_max_interval']
-                        proc_count = len(processed_ids)
-                        my_rules = len(user_conf['keywords'])
-                        settings = user_conf.get('settings', {})
-                        match_summary = "开" if settings.get('match_summary') else "关"
-                        full_word = "开" if settings.get('full_word_match') else "关"
-                        regex = "开" if settings.get('regex_match') else "关"
-                        sys_info = ""
-                        if chat_id == os.environ.get('TG_CHAT_ID', '').strip():
-                            sys_info = (
-                                f"\n<b>💻 系统指标</b>\n"
-                                f"检测间隔: {min_int}-{max_int}s\n"
-                                f"已处理ID: {proc_count}\n"
-                                f"连续错误: {last_rss_error or '无'}\n"
-                            )
-                        msg = (
-                            f"<b>📊 状态报告</b>\n"
-                            f"运行时间: {uptime}\n"
-                            f"内存占用: {mem:.1f} MB\n"
-                            f"您的规则: {my_rules} 条\n"
-                            f"匹配摘要: {match_summary} | 全词匹配: {full_word} | 正则: {regex}\n"
-                            f"{sys_info}"
-                            f"\n最后检测: {last_rss_check_time.strftime('%H:%M:%S') if last_rss_check_time else '从未'}"
-                        )
-                        send_telegram_message(msg, bot_token, chat_id, msg_id)
+                    handler = COMMAND_HANDLERS.get(cmd_raw)
+                    if handler: handler(bot_token, chat_id, msg_id, args_str, user_conf)
                 except Exception as e:
                     logger.error(f"处理消息异常: {e}")
                 finally:
                     if user_conf is not None and __uc_orig is not None:
                         __uc_new = json.dumps(user_conf, ensure_ascii=False, sort_keys=True)
                         if __uc_new != __uc_orig:
+                            # 写回与标记在同一把锁内完成，避免期间的外部重载丢弃本次修改
                             with config_lock:
                                 global_config['users'][chat_id] = user_conf
-                            save_main_config()
-            time.sleep(1)
+                                mark_config_dirty()
+            if updates: save_json(OFFSET_FILE, {'bot_id': bot_id, 'offset': offset})
+        except requests.exceptions.ReadTimeout:
+            # 长轮询期间无消息时的正常超时，直接发起下一轮
+            continue
         except Exception as e:
             logger.error(f"指令监听异常: {e}")
-            time.sleep(5)
+            error_backoff = backoff_sleep(error_backoff)
 
 def check_rss_feed():
-    global last_rss_check_time, last_rss_error
+    global last_rss_check_time, last_rss_error, feed_etag, feed_last_modified, feed_body_hash
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'}
-        resp = requests.get("https://rss.nodeseek.com/", headers=headers, timeout=30)
+        # 条件请求：源未更新时服务器返回 304，无需下载与解析
+        headers = {}
+        if feed_etag: headers['If-None-Match'] = feed_etag
+        if feed_last_modified: headers['If-Modified-Since'] = feed_last_modified
+        resp = rss_session.get(RSS_URL, headers=headers, timeout=30)
+        if resp.status_code == 304:
+            last_rss_check_time = datetime.datetime.now()
+            last_rss_error = None
+            return
         if resp.status_code != 200: return
 
-        feed = feedparser.parse(resp.content)
+        # 响应体与上次完全一致时跳过解析
+        body_hash = hashlib.blake2b(resp.content, digest_size=16).hexdigest()
+        if body_hash == feed_body_hash:
+            last_rss_check_time = datetime.datetime.now()
+            last_rss_error = None
+            return
+
+        feed = fastfeedparser.parse(resp.content)
         if not feed.entries: return
 
         last_rss_check_time = datetime.datetime.now()
@@ -547,151 +844,233 @@ def check_rss_feed():
         bot_token = os.environ.get('TG_BOT_TOKEN')
         if not bot_token: return
 
-        regex_cache = {}
-        processed_changed = False
-
-        for entry in feed.entries:
-            link = getattr(entry, 'link', '').strip()
-            if not link: continue
-            if hasattr(entry, 'id') and entry.id: key = entry.id
-            else: key = hashlib.md5(link.encode()).hexdigest()
-
-            # 快速跳过已处理的条目
-            with config_lock:
-                if key in processed_ids:
-                    continue
-
-            title = getattr(entry, 'title', '').strip()
-            summary = getattr(entry, 'summary', '') or getattr(entry, 'description', '')
-            author = getattr(entry, 'author', '') or getattr(entry, 'dc_creator', '') or 'unknown'
-
-            # 开始处理
-            def clean_html(t): return re.sub(r'<[^>]+>', '', t).strip()
-            title = clean_html(title)
-            summary = clean_html(summary)
-            author = clean_html(author)
-            
-            pub_date_str = ""
-            try:
-                if hasattr(entry, 'published_parsed') and entry.published_parsed:
-                    dt_utc = datetime.datetime(*entry.published_parsed[:6])
-                    dt_bj = dt_utc + datetime.timedelta(hours=8)
-                    pub_date_str = dt_bj.strftime('%Y-%m-%d %H:%M:%S')
-                elif hasattr(entry, 'updated_parsed') and entry.updated_parsed:
-                    dt_utc = datetime.datetime(*entry.updated_parsed[:6])
-                    dt_bj = dt_utc + datetime.timedelta(hours=8)
-                    pub_date_str = dt_bj.strftime('%Y-%m-%d %H:%M:%S')
-            except Exception as e:
-                logger.debug(f"解析发布时间失败: {e}")
-            
-            # 遍历所有用户进行匹配
-            with config_lock:
-                users_copy = copy.deepcopy(global_config['users'])
-            for chat_id, user_conf in users_copy.items():
-                keywords = user_conf['keywords']
-                if not keywords: continue
-                settings = user_conf['settings']
-                match_summary = settings.get('match_summary', False)
-                full_word = settings.get('full_word_match', False)
-                use_regex = settings.get('regex_match', False)
-                
-                text_to_check = title.lower()
-                if match_summary: text_to_check += " " + summary.lower()
-                
-                is_blocked = False
-                for block in user_conf.get('global_exclude', []):
-                    if check_match(text_to_check, block.lower(), False, use_regex, regex_cache):
-                        is_blocked = True
-                        break
-                if is_blocked: continue
-                
-                matched_rules = []
-                for rule in keywords:
-                    base = rule['word'].lower()
-                    if not check_match(text_to_check, base, full_word, use_regex, regex_cache): continue
-                    
-                    hit_ex = False
-                    for ex in rule.get('exclude', []):
-                        if check_match(text_to_check, ex.lower(), False, use_regex, regex_cache):
-                            hit_ex = True
-                            break
-                    if hit_ex: continue
-                    
-                    includes = rule.get('include', [])
-                    if includes:
-                        hit_in = False
-                        for inc in includes:
-                            if check_match(text_to_check, inc.lower(), False, use_regex, regex_cache):
-                                hit_in = True
-                                break
-                        if not hit_in: continue
-                    matched_rules.append(rule['word'])
-                
-                if matched_rules:
-                    kws_str = ", ".join(matched_rules)
-                    msg = (
-                        f"<b>🎯 发现命中帖子</b>\n"
-                        f"• <b>标题</b>：{title}\n"
-                        f"• <b>匹配</b>：{kws_str}\n"
-                        f"• <b>作者</b>：{author}\n"
-                        f"• <b>时间</b>：{pub_date_str}\n"
-                        f"• <b>链接</b>：{link}"
-                    )
-                    if send_telegram_message(msg, bot_token, chat_id):
-                        logger.info(f"向用户 {chat_id} 推送: {title} (规则: {kws_str})")
-            
-            # 标记为已处理
-            with config_lock:
-                if key not in processed_ids:
-                    processed_ids.add(key)
-                    processed_changed = True
+        process_feed_entries(feed.entries, bot_token)
 
-        # 颗粒化保存
-        if processed_changed: save_processed()
+        # 全部条目处理完成后才记录校验值，避免处理异常时后续的 304 跳过未处理的条目
+        feed_etag = resp.headers.get('ETag')
+        feed_last_modified = resp.headers.get('Last-Modified')
+        feed_body_hash = body_hash
             
     except Exception as e:
         last_rss_error = str(e)
         logger.error(f"RSS检测失败: {e}")
 
+def process_feed_entries(entries, bot_token):
+    """匹配未处理的条目并推送通知"""
+    # 一次加锁批量筛出未处理的条目，无新帖时直接返回
+    pending = {}
+    for entry in entries:
+        link = (entry.get('link') or '').strip()
+        if not link: continue
+        key = entry.get('id')
+        if not key: key = hashlib.blake2b(link.encode(), digest_size=8).hexdigest()  # 非加密用途，短摘要即可
+        pending.setdefault(key, (link, entry))
+    with config_lock:
+        pending = [(k, v[0], v[1]) for k, v in pending.items() if k not in processed_ids]
+    if not pending: return
+
+    compiled_users, need_summary = get_compiled_rules()
+    processed_changed = False
+    notifications = {}  # chat_id -> [(msg, title, kws_str)]
+
+    for key, link, entry in pending:
+        title = (entry.get('title') or '').strip()
+        author = entry.get('author') or entry.get('dc_creator') or 'unknown'
+
+        # 开始处理
+        title = strip_tags(title).strip()
+        author = strip_tags(author).strip()
+        # 小写文本每个条目只计算一次，所有用户共用；摘要仅在有用户开启摘要匹配时处理
+        title_lc = title.lower()
+        full_text_lc = title_lc
+        if need_summary:
+            summary = entry.get('summary') or entry.get('description') or ''
+            summary = strip_tags(summary).strip()
+            # 与原逻辑一致：摘要为空时也保留分隔空格（影响 $、\s 等正则的匹配结果）
+            full_text_lc = title_lc + " " + summary.lower()
+        
+        pub_date_str = ""
+        try:
+            # fastfeedparser 返回 ISO 8601 格式的时间字符串
+            published = entry.get('published') or entry.get('updated')
+            if published:
+                dt = datetime.datetime.fromisoformat(published.replace('Z', '+00:00'))
+                if dt.tzinfo:
+                    dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+                dt_bj = dt + datetime.timedelta(hours=8)
+                pub_date_str = dt_bj.strftime('%Y-%m-%d %H:%M:%S')
+        except Exception as e:
+            logger.debug(f"解析发布时间失败: {e}")
+        
+        # 遍历所有用户进行匹配
+        for chat_id, matcher in compiled_users.items():
+            matched_rules = matcher(title_lc, full_text_lc)
+            if matched_rules:
+                kws_str = ", ".join(matched_rules)
+                msg = (
+                    f"<b>🎯 发现命中帖子</b>\n"
+                    f"• <b>标题</b>：{title}\n"
+                    f"• <b>匹配</b>：{kws_str}\n"
+                    f"• <b>作者</b>：{author}\n"
+                    f"• <b>时间</b>：{pub_date_str}\n"
+                    f"• <b>链接</b>：{link}"
+                )
+                notifications.setdefault(chat_id, []).append((msg, title, kws_str))
+        
+        # 标记为已处理
+        with config_lock:
+            if mark_processed(key):
+                processed_changed = True
+
+    # 各用户并发推送，同一用户内保持帖子顺序
+    if notifications:
+        futures_wait([notify_executor.submit(send_notifications, chat_id, items, bot_token)
+                      for chat_id, items in notifications.items()])
+
+    # 颗粒化保存
+    if processed_changed: save_processed()
+
+def match_rules(patterns, text):
+    """逐个模式匹配用户规则（完整词/正则模式，模式已预编译），返回命中的规则词"""
+    for block in patterns['global_exclude']:
+        if check_match(text, block):
+            return []
+
+    matched_rules = []
+    for word, base, includes, excludes in patterns['keywords']:
+        if not check_match(text, base): continue
+
+        hit_ex = False
+        for ex in excludes:
+            if check_match(text, ex):
+                hit_ex = True
+                break
+        if hit_ex: continue
+
+        if includes:
+            hit_in = False
+            for inc in includes:
+                if check_match(text, inc):
+                    hit_in = True
+                    break
+            if not hit_in: continue
+        matched_rules.append(word)
+    return matched_rules
+
+def match_rules_by_hits(rules, hits):
+    """根据 Aho-Corasick 扫描得到的命中词集合判断用户规则，返回命中的规则词"""
+    if not hits or not hits.isdisjoint(rules['global_exclude']):
+        return []
+    return [
+        word for word, base, includes, excludes in rules['keywords']
+        if base in hits and hits.isdisjoint(excludes) and (not includes or not hits.isdisjoint(includes))
+    ]
+
+def build_automaton(rules):
+    """为纯子串模式的用户构建 Aho-Corasick 自动机，覆盖其全部关键词/必含/排除/屏蔽词"""
+    patterns = set(rules['global_exclude'])
+    for _, base, includes, excludes in rules['keywords']:
+        patterns.add(base)
+        patterns.update(includes)
+        patterns.update(excludes)
+    patterns.discard('')
+    if not patterns:
+        return None
+    automaton = ahocorasick.Automaton()
+    for p in patterns:
+        automaton.add_word(p, p)
+    automaton.make_automaton()
+    return automaton
+
+def build_matcher(rules):
+    """按用户设置预先选定匹配方式，返回 matcher(title_lc, full_text_lc) -> 命中的规则词列表"""
+    use_summary = rules['match_summary']
+    full_word, use_regex = rules['full_word'], rules['use_regex']
+    if full_word or use_regex:
+        # 所有模式在此一次性编译，匹配时只做 search / 子串判断
+        patterns = {
+            'global_exclude': [precompile_pattern(b, False, use_regex) for b in rules['global_exclude']],
+            'keywords': [
+                (word, precompile_pattern(base, full_word, use_regex),
+                 [precompile_pattern(i, False, use_regex) for i in includes],
+                 [precompile_pattern(e, False, use_regex) for e in excludes])
+                for word, base, includes, excludes in rules['keywords']
+            ]
+        }
+        text_limit = REGEX_TEXT_LIMIT if use_regex else None
+        prefilter = build_prefilter([base for _, base, _, _ in patterns['keywords']])
+        def matcher(title_lc, full_text_lc):
+            text = (full_text_lc if use_summary else title_lc)[:text_limit]
+            # 绝大多数条目不命中任何关键词，先用合并后的正则一次扫描排除
+            if prefilter is not None and not prefilter.search(text):
+                return []
+            return match_rules(patterns, text)
+        return matcher
+
+    # 纯子串模式：一次扫描得到所有命中的词，再按集合判断规则
+    automaton = build_automaton(rules)
+    if automaton is None:
+        return lambda title_lc, full_text_lc: []
+    def matcher(title_lc, full_text_lc):
+        hits = {p for _, p in automaton.iter(full_text_lc if use_summary else title_lc)}
+        return match_rules_by_hits(rules, hits)
+    return matcher
+
+def build_prefilter(bases):
+    """将用户全部主关键词的预编译模式合并为一个交替正则，用于快速判断是否可能命中；无法合并时返回 None"""
+    bases = [b for b in bases if b is not None]
+    # 含捕获组的正则拼接后组号会错位（反向引用失效），退回逐个匹配
+    if not bases or any(b.groups for b in bases):
+        return None
+    # 含内联全局标志（如 (?x)）的正则拼接后标志会作用于整个交替式（Python 3.11 以前仅告警不报错），同样退回
+    default_flags = re.IGNORECASE | re.UNICODE
+    if any(b.flags != default_flags for b in bases):
+        return None
+    try:
+        combined = re.compile('|'.join(f'(?:{b.pattern})' for b in bases), re.IGNORECASE)
+    except (re.error, OverflowError, RecursionError):
+        return None
+    return combined if combined.flags == default_flags else None
+
 def validate_regex(pattern):
-    """验证正则表达式是否安全（长度限制 + 编译测试）"""
+    """验证正则表达式是否安全（长度限制 + 编译测试，编译结果进入 LRU 供后续复用）"""
     if not pattern or len(pattern) > 100:
         return False
     try:
-        re.compile(pattern)
+        compile_pattern(pattern, True)
         return True
-    except:
+    except (re.error, OverflowError, RecursionError):
+        # 重复次数过大（如 a{99999999999}）会抛 OverflowError，同样视为不安全
         return False
 
-def safe_regex_search(compiled_re, text, timeout_chars=10000):
-    """安全的正则搜索，通过限制文本长度防止 ReDoS"""
-    # 截断过长文本，防止病态输入
-    if len(text) > timeout_chars:
-        text = text[:timeout_chars]
-    try:
-        return bool(compiled_re.search(text))
-    except:
-        return False
+@functools.lru_cache(maxsize=1024)
+def compile_pattern(pattern, use_regex):
+    """编译并缓存正则（进程级 LRU，跨轮询复用）"""
+    if use_regex:
+        return re.compile(pattern, re.IGNORECASE)
+    return re.compile(rf"\b{re.escape(pattern)}\b", re.IGNORECASE)
 
-def check_match(text, pattern, full_word, use_regex, cache):
-    if not pattern: return False
+def precompile_pattern(pattern, full_word, use_regex):
+    """预编译单个模式：正则/完整词返回 Pattern，纯子串返回原字符串，空或不安全的正则返回 None"""
+    if not pattern: return None
     if use_regex:
         if not validate_regex(pattern):
             logger.warning(f"跳过不安全的正则表达式: {pattern}")
-            return False
-        try:
-            if pattern not in cache: cache[pattern] = re.compile(pattern, re.IGNORECASE)
-            return safe_regex_search(cache[pattern], text)
-        except Exception as e:
-            logger.error(f"正则匹配失败: {e}")
-            return False
+            return None
+        return compile_pattern(pattern, True)
     if full_word:
-        if pattern not in cache: cache[pattern] = re.compile(rf"\b{re.escape(pattern)}\b", re.IGNORECASE)
-        return bool(cache[pattern].search(text))
-    return pattern in text
+        return compile_pattern(pattern, False)
+    return pattern
+
+def check_match(text, pattern):
+    """按预编译模式的类型分派匹配"""
+    if pattern is None: return False
+    if isinstance(pattern, str): return pattern in text
+    return bool(pattern.search(text))
 
 def restart_program(reason):
     logger.info(f"重启: {reason}")
+    flush_config()  # execv 不会触发 atexit，需先写盘
     os.execv(sys.executable, [sys.executable] + sys.argv)
 
 def monitor_loop():
@@ -699,6 +1078,7 @@ def monitor_loop():
     error_count = 0
     while True:
         try:
+            reload_config_if_changed()
             check_rss_feed()
             error_count = 0
         except Exception as e:
@@ -707,8 +1087,7 @@ def monitor_loop():
             if error_count >= 15: restart_program("连续错误过多")
             
         try:
-            proc = psutil.Process()
-            mem = proc.memory_info().rss / 1024 / 1024
+            mem = self_process.memory_info().rss / 1024 / 1024
             uptime_h = (datetime.datetime.now() - start_time).total_seconds() / 3600
             if uptime_h > 24 or mem > 800: restart_program(f"维护重启 (Mem:{mem:.0f}MB, Time:{uptime_h:.1f}h)")
         except Exception as e:
@@ -729,6 +1108,11 @@ if __name__ == "__main__":
     # 初始化全局配置和已处理ID
     load_config()
 
+    # 退出时写入未保存的配置（SIGTERM 转为正常退出以触发 atexit）
+    atexit.register(flush_config)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    Thread(target=config_flush_loop, daemon=True).start()
+
     t = Thread(target=telegram_command_listener, daemon=True)
     t.start()
     monitor_loop()
\ No newline at end of file